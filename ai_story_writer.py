@@ -6,8 +6,15 @@
 
 import streamlit as st
 
-from api import get_client, generate_with_retry
-from config import DEFAULT_MODEL_NAME, GROQ_MODEL_NAME, WORDS_PER_PAGE
+from api import get_client
+from config import (
+    DEFAULT_MODEL_NAME,
+    GROQ_MODEL_NAME,
+    NOVELTY_MAX_RETRIES,
+    NOVELTY_THRESHOLD,
+    WORDS_PER_PAGE,
+)
+from novelty import NoveltyChecker, max_continuation_calls
 from prompts import (
     build_story_persona,
     get_premise_prompt,
@@ -15,13 +22,15 @@ from prompts import (
     get_starting_prompt,
     get_continuation_prompt,
 )
-from utils import word_count, trim_to_complete_sentences, format_story_paragraphs
+from quota import QuotaExceededError, get_scheduler
+from segmenter import SentenceSegmenter
+from utils import word_count
 
 
 def ai_story_generator(persona, story_setting, character_input,
                        plot_elements, writing_style, story_tone, narrative_pov,
                        audience_age_group, content_rating, ending_preference, page_length=3,
-                       backend="gemini"):
+                       backend="gemini", tenant="anonymous", reservation=None):
     """
     Write a story using prompt chaining and iterative generation.
 
@@ -37,6 +46,9 @@ def ai_story_generator(persona, story_setting, character_input,
         content_rating: e.g. G, PG, PG-13, R.
         ending_preference: e.g. Happy, Tragic, Cliffhanger, Twist.
         page_length: Number of pages (default 3).
+        backend: "gemini" | "groq".
+        tenant: Id the LLM calls are accounted and scheduled under (one per session).
+        reservation: Reservation from FairScheduler.admit() the calls are drawn from.
     """
     st.info(f"""
         You have chosen to create a story set in **{story_setting}**. 
@@ -66,16 +78,19 @@ def ai_story_generator(persona, story_setting, character_input,
             st.error(f"API key not set. Add {key_name} in Streamlit Cloud Secrets or set the environment variable.")
             return
         model_name = GROQ_MODEL_NAME if backend == "groq" else DEFAULT_MODEL_NAME
+        scheduler = get_scheduler()
 
         # Generate prompts
         try:
-            premise = generate_with_retry(client, premise_prompt, model_name, backend).text
+            premise = scheduler.generate(tenant, client, premise_prompt, model_name, backend, reservation).text
             st.info(f"The premise of the story is: {premise}")
         except Exception as err:
             st.error(f"Premise Generation Error: {err}")
             return
 
-        outline = generate_with_retry(client, outline_prompt.format(premise=premise), model_name, backend).text
+        outline = scheduler.generate(
+            tenant, client, outline_prompt.format(premise=premise), model_name, backend, reservation
+        ).text
         with st.expander("🧙‍♂️ Click to Checkout the outline, writing still in progress..", expanded=True):
             st.markdown(f"The Outline of the story is: {outline}\n\n")
         
@@ -86,55 +101,72 @@ def ai_story_generator(persona, story_setting, character_input,
         # Generate starting draft
         with st.status("🦸Story Writing in Progress..", expanded=True) as status:
             try:
-                starting_draft = generate_with_retry(
-                    client, starting_prompt.format(premise=premise, outline=outline), model_name, backend
+                starting_draft = scheduler.generate(
+                    tenant, client, starting_prompt.format(premise=premise, outline=outline), model_name, backend,
+                    reservation,
                 ).text
                 status.update(label=f"🪂 Current draft length: {len(starting_draft)} characters")
             except Exception as err:
                 st.error(f"Failed to Generate Story draft: {err}")
                 return False
 
-            try:
-                draft = starting_draft
-                continuation = generate_with_retry(
-                    client,
-                    continuation_prompt.format(premise=premise, outline=outline, story_text=draft),
-                    model_name,
-                    backend,
-                ).text
-                status.update(label=f"🏄 Current draft length: {len(continuation)} characters")
-            except Exception as err:
-                st.error(f"Failed to write the initial draft: {err}")
-
-            # Add the continuation to the initial draft, keep building the story until we see 'IAMDONE'
-            try:
-                draft += '\n\n' + continuation
-                status.update(label=f"Current draft length: {len(draft)} characters")
-            except Exception as err:
-                st.error(f"Failed as: {err} and {continuation}")
-        
-            while 'IAMDONE' not in continuation and word_count(draft) < target_words:
+            # Keep building the story until we see 'IAMDONE', reach the target length,
+            # run out of continuation calls, or the model stops adding new content.
+            # Near-empty replies are stalls too: text shorter than a shingle scores 0.0.
+            draft = starting_draft
+            draft_words = word_count(draft)
+            checker = NoveltyChecker(draft)
+            segmenter = SentenceSegmenter()
+            segmenter.feed(draft.replace('IAMDONE', ''))
+            max_calls = max_continuation_calls(page_length)
+            calls = 0
+            stalls = 0
+            while draft_words < target_words and calls < max_calls:
                 try:
-                    status.update(label=f"⏳ Writing... {word_count(draft)} / {target_words} words")
-                    continuation = generate_with_retry(
+                    status.update(label=f"⏳ Writing... {draft_words} / {target_words} words")
+                    continuation = scheduler.generate(
+                        tenant,
                         client,
                         continuation_prompt.format(premise=premise, outline=outline, story_text=draft),
                         model_name,
                         backend,
+                        reservation,
                     ).text
-                    draft += '\n\n' + continuation
+                    calls += 1
+                except QuotaExceededError as err:
+                    # Keep what has been paid for rather than discarding the draft.
+                    st.warning(f"{err} Finishing with the story written so far.")
+                    break
                 except Exception as err:
                     st.error(f"Failed to continually write the story: {err}")
                     return
+                if 'IAMDONE' in continuation:
+                    draft += '\n\n' + continuation
+                    segmenter.feed('\n\n' + continuation.replace('IAMDONE', ''))
+                    break
+                new_words = word_count(continuation)
+                if checker.novelty(continuation) < NOVELTY_THRESHOLD:
+                    stalls += 1
+                    print(f"Continuation {calls} added little new content ({new_words} words)")
+                    if stalls > NOVELTY_MAX_RETRIES:
+                        print(f"Continuation loop stopped (stall) after {calls} of {max_calls} calls; "
+                              f"saved {max_calls - calls}")
+                        break
+                    continue
+                stalls = 0
+                checker.add(continuation)
+                draft += '\n\n' + continuation
+                segmenter.feed('\n\n' + continuation)
+                draft_words += new_words
+            else:
+                if draft_words < target_words:
+                    print(f"Continuation loop stopped (cap) at {max_calls} calls with "
+                          f"{draft_words} / {target_words} words")
             status.update(label=f"✔️  Story Completed ✔️ ... Scroll Down for the story.")
 
-        # Remove 'IAMDONE' and trim to target word count at a sentence boundary
-        final = draft.replace('IAMDONE', '').strip()
-        words = final.split()
-        if len(words) > target_words:
-            final = trim_to_complete_sentences(final, target_words)
-        final = format_story_paragraphs(final)
-        return final
+        # Trim to target word count at a sentence boundary ('IAMDONE' was never fed)
+        segmenter.finish()
+        return segmenter.paragraphs(max_words=target_words)
 
     except Exception as e:
         st.error(f"Main Story writing: An error occurred: {e}")
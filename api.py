@@ -8,10 +8,11 @@ from config import FALLBACK_MODELS, GROQ_MODEL_NAME
 
 
 class _TextResponse:
-    """Wrapper so callers can use .text for both Gemini and Groq."""
+    """Wrapper so callers can use .text (and .tokens) for both Gemini and Groq."""
 
-    def __init__(self, text):
+    def __init__(self, text, tokens=0):
         self.text = text or ""
+        self.tokens = tokens or 0
 
 
 def get_gemini_api_key():
@@ -53,21 +54,34 @@ def get_client(backend="gemini"):
     return genai.Client(api_key=api_key)
 
 
-def generate_with_retry(client, prompt, model_name, backend="gemini"):
+def response_tokens(response):
+    """Return total tokens used by a generate_with_retry response, or 0 if unknown."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        return getattr(usage, "total_token_count", 0) or 0
+    return getattr(response, "tokens", 0)
+
+
+def generate_with_retry(client, prompt, model_name, backend="gemini", on_attempt=None):
     """
     Generate text from the model. Returns an object with .text (same for Gemini and Groq).
     backend: "gemini" | "groq"
+    on_attempt: optional callable(model) run before every API request, including retries
+    and fallbacks, so callers can account for each one.
     """
     if backend == "groq":
         last_error = None
         for attempt in range(2):
+            if on_attempt is not None:
+                on_attempt(model_name)
             try:
                 response = client.chat.completions.create(
                     messages=[{"role": "user", "content": prompt}],
                     model=model_name,
                 )
                 content = response.choices[0].message.content
-                return _TextResponse(content)
+                usage = getattr(response, "usage", None)
+                return _TextResponse(content, getattr(usage, "total_tokens", 0))
             except Exception as e:
                 last_error = e
                 msg = str(e).upper()
@@ -81,6 +95,8 @@ def generate_with_retry(client, prompt, model_name, backend="gemini"):
     models_to_try = [model_name] + [m for m in FALLBACK_MODELS if m != model_name]
     last_error = None
     for candidate_model in models_to_try:
+        if on_attempt is not None:
+            on_attempt(candidate_model)
         try:
             response = client.models.generate_content(
                 model=candidate_model,
@@ -9,6 +9,12 @@ SLIDER_MIN = 1
 SLIDER_MAX = 10
 SLIDER_DEFAULT = 3
 
+# Continuation loop
+CONTINUATION_CALL_SLACK = 2  # extra continuation calls allowed beyond one per page
+NOVELTY_SHINGLE_SIZE = 5
+NOVELTY_THRESHOLD = 0.5  # min fraction of new shingles for a continuation to count
+NOVELTY_MAX_RETRIES = 1  # low-novelty continuations in a row before stopping
+
 # Model - Gemini
 DEFAULT_MODEL_NAME = "gemini-2.5-flash-lite"
 FALLBACK_MODELS = ["gemini-2.5-flash-lite", "gemini-2.5-flash"]
@@ -17,6 +23,26 @@ FALLBACK_MODELS = ["gemini-2.5-flash-lite", "gemini-2.5-flash"]
 GROQ_MODEL_NAME = "llama-3.3-70b-versatile"
 BACKENDS = ["Gemini", "Groq"]
 
+# Usage quotas (requests). Backend limits are for the shared API key; tenant limits
+# are per user session, so one session cannot use up the key for everyone.
+QUOTA_DB_PATH = "usage.sqlite3"
+BACKEND_LIMITS = {
+    "gemini": {"per_minute": 10, "per_day": 20},
+    "groq": {"per_minute": 30, "per_day": 1000},
+}
+TENANT_LIMITS = {
+    "gemini": {"per_minute": 5, "per_day": 15},
+    "groq": {"per_minute": 10, "per_day": 200},
+}
+DEFAULT_TENANT_WEIGHT = 1.0
+STORY_SETUP_CALLS = 3  # premise, outline, starting draft
+RESERVATION_TTL = 60 * 60  # seconds before an unreleased story reservation lapses
+
+# Story store: session state keeps a handle; bodies are compressed and LRU-bounded
+STORY_STORE_DIR = ".story_store"
+STORY_STORE_MAX_MEMORY_BYTES = 8 * 1024 * 1024  # compressed bodies kept in memory
+STORY_STORE_MAX_FILES = 2000  # evicted bodies kept on disk
+
 # Personas
 PERSONAS = [
     ("Award-Winning Science Fiction Author", "👽 Award-Winning Science Fiction Author"),
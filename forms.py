@@ -1,5 +1,7 @@
-import html
+import hashlib
 import json
+import uuid
+
 import streamlit as st
 
 from ai_story_writer import ai_story_generator
@@ -18,6 +20,15 @@ from config import (
     CONTENT_RATINGS,
     ENDING_PREFERENCES,
 )
+from quota import get_scheduler
+from story_store import get_story_store
+
+
+def get_tenant_id():
+    """Return the id this session's LLM usage is accounted under."""
+    if "tenant_id" not in st.session_state:
+        st.session_state["tenant_id"] = uuid.uuid4().hex
+    return st.session_state["tenant_id"]
 
 
 def input_section():
@@ -138,35 +149,63 @@ def input_section():
         page_length,
         backend,
     )
-    if "last_inputs" in st.session_state and st.session_state["last_inputs"] != current_inputs:
-        for key in ("last_story", "last_inputs"):
-            if key in st.session_state:
-                del st.session_state[key]
+    # Session state holds only a story handle and a digest of the inputs it was written for.
+    inputs_key = hashlib.sha1(repr(current_inputs).encode("utf-8")).hexdigest()
+    store = get_story_store()
+    if "last_inputs_key" in st.session_state and st.session_state["last_inputs_key"] != inputs_key:
+        store.delete(st.session_state.pop("story_handle", None))
+        del st.session_state["last_inputs_key"]
 
     if st.button('AI, Write a Story..'):
-        if character_input.strip():
-            with st.spinner("Generating Story...💥💥"):
-                story_content = ai_story_generator(
-                    PERSONA_DESCRIPTIONS[selected_persona_name],
-                    story_setting, character_input, plot_elements, writing_style,
-                    story_tone, narrative_pov, audience_age_group, content_rating,
-                    ending_preference, page_length, backend=backend,
-                )
-                if story_content:
-                    st.session_state["last_story"] = story_content
-                    st.session_state["last_inputs"] = current_inputs
-                else:
-                    st.error("💥 **Failed to generate Story. Please try again!**")
-        else:
+        if not character_input.strip():
             st.error("Describe the story you have in your mind.. !")
+        else:
+            tenant = get_tenant_id()
+            scheduler = get_scheduler()
+            reservation, reason = scheduler.admit(tenant, backend, page_length)
+            if reservation is None:
+                st.error(reason)
+            else:
+                with st.spinner("Generating Story...💥💥"):
+                    try:
+                        story_content = ai_story_generator(
+                            PERSONA_DESCRIPTIONS[selected_persona_name],
+                            story_setting, character_input, plot_elements, writing_style,
+                            story_tone, narrative_pov, audience_age_group, content_rating,
+                            ending_preference, page_length, backend=backend, tenant=tenant,
+                            reservation=reservation,
+                        )
+                    finally:
+                        # Return the calls this story did not use.
+                        scheduler.release(reservation)
+                    if story_content:
+                        store.delete(st.session_state.get("story_handle"))
+                        st.session_state["story_handle"] = store.put(story_content)
+                        st.session_state["last_inputs_key"] = inputs_key
+                    else:
+                        st.error("💥 **Failed to generate Story. Please try again!**")
 
-    if st.session_state.get("last_story") and st.session_state.get("last_inputs") == current_inputs:
+    if st.session_state.get("story_handle") and st.session_state.get("last_inputs_key") == inputs_key:
+        story = store.get(st.session_state["story_handle"])
+        if story is None:
+            del st.session_state["story_handle"]
+            st.info("Your last story has expired. Click **AI, Write a Story..** to write a new one.")
+            return
         st.subheader('**🧕 Your Awesome Story:**')
-        st.markdown(st.session_state["last_story"])
-        story_escaped = html.escape(st.session_state["last_story"])
-        copy_html = (
-            f'<textarea id="story-copy-buf" style="display:none">{story_escaped}</textarea>'
-            '<button onclick="navigator.clipboard.writeText(document.getElementById(\'story-copy-buf\').value); '
-            "this.textContent='Copied!'; setTimeout(function(){ this.textContent='Copy story'; }, 2000);\">Copy story</button>"
-        )
-        st.components.v1.html(copy_html, height=50)
+        st.markdown(story)
+        # Download data is built only on click. Copy uses st.code's copy icon in a
+        # popover: one click once it is open and no rerun, at the cost of sending the
+        # story to the browser a second time.
+        handle = st.session_state["story_handle"]
+        col1, col2 = st.columns(2)
+        with col1:
+            with st.popover("📋 Copy story"):
+                st.code(story, language=None, wrap_lines=True)
+        with col2:
+            st.download_button(
+                "⬇️ Download story",
+                data=lambda: store.get(handle) or "",
+                file_name="story.md",
+                mime="text/markdown",
+                on_click="ignore",
+            )
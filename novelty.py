@@ -0,0 +1,55 @@
+"""
+Repetition and stall detection for the continuation loop.
+Each continuation is compared against the draft so far using hashed word shingles.
+"""
+import re
+
+from config import CONTINUATION_CALL_SLACK, NOVELTY_SHINGLE_SIZE
+
+
+def max_continuation_calls(page_length):
+    """Return the hard cap on continuation calls for a story of page_length pages."""
+    return max(1, page_length) + CONTINUATION_CALL_SLACK
+
+
+class NoveltyChecker:
+    """
+    Track hashed n-gram shingles of the draft and score new text against them.
+    Work per call is proportional to the new text only; the draft is never rescanned.
+    """
+
+    def __init__(self, text="", shingle_size=NOVELTY_SHINGLE_SIZE):
+        self.shingle_size = shingle_size
+        self._seen = set()
+        self._tail = []
+        self.add(text)
+
+    def _tokens(self, text):
+        return re.findall(r'\w+', text.lower())
+
+    def _shingles(self, tokens):
+        n = self.shingle_size
+        for i in range(len(tokens) - n + 1):
+            yield hash(tuple(tokens[i:i + n]))
+
+    def novelty(self, text):
+        """
+        Return the fraction (0.0-1.0) of shingles in text not already in the draft.
+        Shingles repeated within text itself only count as new once.
+        """
+        tokens = self._tokens(text)
+        total = 0
+        fresh = set()
+        for shingle in self._shingles(tokens):
+            total += 1
+            if shingle not in self._seen:
+                fresh.add(shingle)
+        if total == 0:
+            return 0.0
+        return len(fresh) / total
+
+    def add(self, text):
+        """Record text as part of the draft."""
+        tokens = self._tail + self._tokens(text)
+        self._seen.update(self._shingles(tokens))
+        self._tail = tokens[-(self.shingle_size - 1):] if self.shingle_size > 1 else []
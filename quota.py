@@ -0,0 +1,402 @@
+"""
+Per-tenant usage accounting and fair-share scheduling of LLM calls.
+Every API request is recorded in a SQLite ledger; the scheduler enforces per-minute
+and per-day request quotas and serves waiting tenants in weighted fair-queue order.
+"""
+import heapq
+import itertools
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import closing
+
+from api import generate_with_retry, response_tokens
+from config import (
+    BACKEND_LIMITS,
+    DEFAULT_TENANT_WEIGHT,
+    QUOTA_DB_PATH,
+    RESERVATION_TTL,
+    STORY_SETUP_CALLS,
+    TENANT_LIMITS,
+)
+from novelty import max_continuation_calls
+
+MINUTE = 60
+DAY = 24 * 60 * 60
+
+
+class QuotaExceededError(RuntimeError):
+    """Raised when a tenant or backend has used up its daily request quota."""
+
+
+def predicted_calls(page_length):
+    """Return the most LLM calls a story of page_length pages can make."""
+    return STORY_SETUP_CALLS + max_continuation_calls(page_length)
+
+
+class UsageLedger:
+    """
+    Requests and tokens per tenant, backend and model, persisted in SQLite, plus
+    reservations of calls for stories that have been admitted but not finished.
+    """
+
+    def __init__(self, path=QUOTA_DB_PATH):
+        self.path = path
+        with self._connect() as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "id INTEGER PRIMARY KEY, tenant TEXT NOT NULL, backend TEXT NOT NULL, "
+                "model TEXT NOT NULL, ts REAL NOT NULL, requests INTEGER NOT NULL DEFAULT 1, "
+                "tokens INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS usage_backend_ts ON usage (backend, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS usage_tenant_ts ON usage (tenant, backend, ts)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS reservations ("
+                "id INTEGER PRIMARY KEY, tenant TEXT NOT NULL, backend TEXT NOT NULL, "
+                "ts REAL NOT NULL, calls INTEGER NOT NULL)"
+            )
+
+    def _connect(self):
+        # One connection per operation keeps the ledger safe across Streamlit threads.
+        return closing(sqlite3.connect(self.path, timeout=30))
+
+    def record(self, tenant, backend, model, tokens=0, ts=None, reservation=None, per_day=None):
+        """
+        Record one request (drawing it from reservation, if given) and return its row id.
+        With per_day=(tenant_limit, backend_limit), a request not covered by the
+        reservation is only recorded if it fits both daily limits; otherwise None.
+        """
+        now = time.time() if ts is None else ts
+        with self._connect() as conn, conn:
+            # Take the write lock up front so the check and the insert are atomic.
+            conn.execute("BEGIN IMMEDIATE")
+            if per_day is not None and not self._left(conn, reservation, now):
+                tenant_limit, backend_limit = per_day
+                if (self._held(conn, backend, now, tenant, reservation) >= tenant_limit
+                        or self._held(conn, backend, now, None, reservation) >= backend_limit):
+                    return None
+            cur = conn.execute(
+                "INSERT INTO usage (tenant, backend, model, ts, tokens) VALUES (?, ?, ?, ?, ?)",
+                (tenant, backend, model, now, tokens),
+            )
+            if reservation is not None:
+                conn.execute(
+                    "UPDATE reservations SET calls = MAX(calls - 1, 0) WHERE id = ?", (reservation,)
+                )
+            return cur.lastrowid
+
+    def add_tokens(self, row_id, tokens):
+        """Add tokens to a recorded request once the response is known."""
+        with self._connect() as conn, conn:
+            conn.execute("UPDATE usage SET tokens = tokens + ? WHERE id = ?", (tokens, row_id))
+
+    def usage(self, backend, window, tenant=None, now=None):
+        """Return (requests, tokens) for backend in the last window seconds."""
+        with self._connect() as conn:
+            return self._usage(conn, backend, window, tenant, time.time() if now is None else now)
+
+    def recent(self, window, now=None):
+        """Return (tenant, backend, ts) for every request in the last window seconds."""
+        since = (time.time() if now is None else now) - window
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT tenant, backend, ts FROM usage WHERE ts >= ? ORDER BY ts", (since,)
+            ).fetchall()
+
+    def reserve(self, tenant, backend, calls):
+        """Hold calls for tenant on backend and return the reservation id."""
+        with self._connect() as conn, conn:
+            cur = conn.execute(
+                "INSERT INTO reservations (tenant, backend, ts, calls) VALUES (?, ?, ?, ?)",
+                (tenant, backend, time.time(), calls),
+            )
+            return cur.lastrowid
+
+    def release(self, reservation):
+        """Drop a reservation, returning its unused calls to the pool."""
+        with self._connect() as conn, conn:
+            conn.execute("DELETE FROM reservations WHERE id = ?", (reservation,))
+
+    def reserved(self, backend, tenant=None, exclude=None, now=None):
+        """Return calls still held by live reservations on backend."""
+        with self._connect() as conn:
+            return self._reserved(conn, backend, tenant, exclude, time.time() if now is None else now)
+
+    def reservation_left(self, reservation, now=None):
+        """Return calls left on a live reservation, or 0 if it is used up or lapsed."""
+        with self._connect() as conn:
+            return self._left(conn, reservation, time.time() if now is None else now)
+
+    def _usage(self, conn, backend, window, tenant, now):
+        query = "SELECT COALESCE(SUM(requests), 0), COALESCE(SUM(tokens), 0) FROM usage WHERE backend = ? AND ts >= ?"
+        params = [backend, now - window]
+        if tenant is not None:
+            query += " AND tenant = ?"
+            params.append(tenant)
+        return conn.execute(query, params).fetchone()
+
+    def _reserved(self, conn, backend, tenant, exclude, now):
+        query = "SELECT COALESCE(SUM(calls), 0) FROM reservations WHERE backend = ? AND ts >= ?"
+        params = [backend, now - RESERVATION_TTL]
+        if tenant is not None:
+            query += " AND tenant = ?"
+            params.append(tenant)
+        if exclude is not None:
+            query += " AND id != ?"
+            params.append(exclude)
+        return conn.execute(query, params).fetchone()[0]
+
+    def _left(self, conn, reservation, now):
+        if reservation is None:
+            return 0
+        row = conn.execute(
+            "SELECT calls FROM reservations WHERE id = ? AND ts >= ?", (reservation, now - RESERVATION_TTL)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _held(self, conn, backend, now, tenant, exclude):
+        """Requests made today plus calls held by reservations other than exclude."""
+        return self._usage(conn, backend, DAY, tenant, now)[0] + self._reserved(conn, backend, tenant, exclude, now)
+
+
+class _Ticket:
+    """A call waiting in the fair queue."""
+
+    def __init__(self, tenant, backend, model, reservation):
+        self.tenant = tenant
+        self.backend = backend
+        self.model = model
+        self.reservation = reservation
+        self.done = False
+        self.granted_at = None
+        self.error = None
+
+
+class FairScheduler:
+    """
+    Weighted fair queue in front of generate_with_retry.
+
+    Each waiting call gets a virtual finish tag of max(virtual time, tenant's last tag)
+    + 1 / weight. Calls are granted in tag order, skipping those whose tenant or
+    backend is at its per-minute quota, so a tenant issuing many calls queues behind
+    others instead of draining the shared key.
+    """
+
+    def __init__(self, ledger=None, backend_limits=None, tenant_limits=None):
+        self.ledger = ledger or UsageLedger()
+        self.backend_limits = backend_limits or BACKEND_LIMITS
+        self.tenant_limits = tenant_limits or TENANT_LIMITS
+        self._weights = {}
+        self._last_tag = {}
+        self._virtual = 0.0
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        # Request timestamps from the last minute, per backend and per (tenant, backend).
+        self._minute = {}
+        self._last_prune = time.time()
+        for tenant, backend, ts in self.ledger.recent(MINUTE):
+            self._minute_window(backend).append(ts)
+            self._minute_window((tenant, backend)).append(ts)
+
+    def set_weight(self, tenant, weight):
+        """
+        Give tenant a larger (or smaller) share of calls relative to others.
+        A weight of None returns tenant to the default.
+        """
+        with self._cond:
+            if weight is None:
+                self._weights.pop(tenant, None)
+            else:
+                self._weights[tenant] = weight
+
+    def remaining_today(self, tenant, backend, exclude=None):
+        """
+        Return how many more requests tenant can make on backend today, counting
+        calls held by reservations other than exclude as already used.
+        """
+        tenant_used, _ = self.ledger.usage(backend, DAY, tenant)
+        tenant_held = self.ledger.reserved(backend, tenant, exclude)
+        backend_used, _ = self.ledger.usage(backend, DAY)
+        backend_held = self.ledger.reserved(backend, exclude=exclude)
+        return max(0, min(
+            self.tenant_limits[backend]["per_day"] - tenant_used - tenant_held,
+            self.backend_limits[backend]["per_day"] - backend_used - backend_held,
+        ))
+
+    def admit(self, tenant, backend, page_length):
+        """
+        Decide whether a story of page_length pages may start, and if so reserve
+        its predicted calls. Returns (reservation, message); reservation is None on
+        refusal and message explains why. Pass the reservation to generate() and
+        release() it when the story ends.
+        """
+        self._check_backend(backend)
+        needed = predicted_calls(page_length)
+        with self._cond:
+            remaining = self.remaining_today(tenant, backend)
+            if remaining >= needed:
+                return self.ledger.reserve(tenant, backend, needed), ""
+        return None, (
+            f"A {page_length}-page story can take up to {needed} requests, but only "
+            f"{remaining} remain today on this backend. Try a shorter story or another backend."
+        )
+
+    def release(self, reservation):
+        """Return a story's unused reserved calls."""
+        if reservation is not None:
+            self.ledger.release(reservation)
+
+    def generate(self, tenant, client, prompt, model_name, backend="gemini", reservation=None):
+        """
+        Call generate_with_retry, making every API request it sends, retries included,
+        wait for tenant's fair turn and count against the quotas. Calls under a
+        reservation with calls left skip the daily check, since they were counted
+        when the story was admitted.
+        """
+        self._check_backend(backend)
+        # Fail fast before queueing; the binding check is made as each request is recorded.
+        prepaid = reservation is not None and self.ledger.reservation_left(reservation) > 0
+        if not prepaid and self.remaining_today(tenant, backend, exclude=reservation) <= 0:
+            raise QuotaExceededError(f"Daily request quota reached for {backend}.")
+
+        rows = []
+
+        def on_attempt(model):
+            rows.append(self._acquire(tenant, backend, model, reservation))
+
+        response = generate_with_retry(client, prompt, model_name, backend, on_attempt=on_attempt)
+        self.ledger.add_tokens(rows[-1], response_tokens(response))
+        return response
+
+    def _check_backend(self, backend):
+        if backend not in self.backend_limits or backend not in self.tenant_limits:
+            raise ValueError(f"No quota configured for backend {backend!r}.")
+
+    def _acquire(self, tenant, backend, model, reservation):
+        """
+        Wait until the fair queue grants tenant a request under the per-minute quotas,
+        then record it against the daily quotas. Returns the ledger row id.
+        """
+        ticket = _Ticket(tenant, backend, model, reservation)
+        with self._cond:
+            weight = self._weights.get(tenant, DEFAULT_TENANT_WEIGHT)
+            tag = max(self._virtual, self._last_tag.get(tenant, 0.0)) + 1.0 / weight
+            self._last_tag[tenant] = tag
+            item = (tag, next(self._seq), ticket)
+            heapq.heappush(self._queue, item)
+            try:
+                while not ticket.done:
+                    self._dispatch()
+                    if not ticket.done:
+                        # Time out so per-minute windows are re-checked as they slide.
+                        self._cond.wait(timeout=1.0)
+            except BaseException:
+                if not ticket.done and item in self._queue:
+                    self._queue.remove(item)
+                    heapq.heapify(self._queue)
+                self._cond.notify_all()
+                raise
+        if ticket.error is not None:
+            raise ticket.error
+
+        # The ledger is written outside the lock so a busy database does not stall the queue.
+        per_day = (self.tenant_limits[backend]["per_day"], self.backend_limits[backend]["per_day"])
+        try:
+            row_id = self.ledger.record(tenant, backend, model, reservation=reservation, per_day=per_day)
+        except BaseException:
+            self._forget(tenant, backend, ticket.granted_at)
+            raise
+        if row_id is None:
+            self._forget(tenant, backend, ticket.granted_at)
+            raise QuotaExceededError(f"Daily request quota reached for {backend}.")
+        return row_id
+
+    def _dispatch(self):
+        """
+        Grant queued calls in tag order while their tenant and backend are under the
+        per-minute quota. Must be called with self._cond held. A ticket is done once
+        granted or once granting it failed (ticket.error).
+        """
+        now = time.time()
+        if now - self._last_prune >= MINUTE:
+            self._prune_idle(now)
+        skipped = []
+        try:
+            while self._queue:
+                item = heapq.heappop(self._queue)
+                ticket = item[2]
+                try:
+                    if not self._under_minute_limits(ticket.tenant, ticket.backend):
+                        skipped.append(item)
+                        continue
+                    self._virtual = max(self._virtual, item[0])
+                    # Count the request now so in-flight requests hold their per-minute slot.
+                    ticket.granted_at = time.time()
+                    self._minute_window(ticket.backend).append(ticket.granted_at)
+                    self._minute_window((ticket.tenant, ticket.backend)).append(ticket.granted_at)
+                except Exception as e:
+                    # Hand the error to the waiting caller instead of losing its ticket.
+                    ticket.error = e
+                ticket.done = True
+        finally:
+            for item in skipped:
+                heapq.heappush(self._queue, item)
+            self._cond.notify_all()
+
+    def _forget(self, tenant, backend, ts):
+        """Give back the per-minute slot of a granted request that was never sent."""
+        with self._cond:
+            for key in (backend, (tenant, backend)):
+                try:
+                    self._minute.get(key, deque()).remove(ts)
+                except ValueError:
+                    pass
+            self._cond.notify_all()
+
+    def _prune_idle(self, now):
+        """
+        Drop per-tenant state that no longer affects scheduling: tags at or behind
+        virtual time (a new call's tag would be the same without them) and empty
+        minute windows. Must be called with self._cond held.
+        """
+        for tenant in [t for t, tag in self._last_tag.items() if tag <= self._virtual]:
+            del self._last_tag[tenant]
+        for key in [k for k in self._minute if self._minute_count(k, now) == 0]:
+            del self._minute[key]
+        self._last_prune = now
+
+    def _minute_window(self, key):
+        window = self._minute.get(key)
+        if window is None:
+            window = self._minute[key] = deque()
+        return window
+
+    def _minute_count(self, key, now):
+        window = self._minute.get(key)
+        if not window:
+            return 0
+        while window and window[0] < now - MINUTE:
+            window.popleft()
+        return len(window)
+
+    def _under_minute_limits(self, tenant, backend):
+        now = time.time()
+        if self._minute_count((tenant, backend), now) >= self.tenant_limits[backend]["per_minute"]:
+            return False
+        return self._minute_count(backend, now) < self.backend_limits[backend]["per_minute"]
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler shared by all sessions."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FairScheduler()
+        return _scheduler
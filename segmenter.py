@@ -0,0 +1,203 @@
+"""
+Incremental sentence segmenter for story post-processing.
+Feed text chunks as they arrive; trimming and paragraph formatting then work
+from the sentence list and running word counts without re-splitting the story.
+
+This trades total CPU for latency at the end of a story: segmenting is ~2.5x the
+cost of a one-shot re.split over the same text, but it runs in feed() while the
+model is still generating, leaving only a bisect and a join once the story is done.
+"""
+import bisect
+import re
+
+# Titles and short forms that are followed by a period but do not end a sentence.
+ABBREVIATIONS = {
+    "Mr", "Mrs", "Ms", "Mx", "Dr", "Prof", "Sr", "Jr", "St", "Mt", "Ft",
+    "Capt", "Gen", "Lt", "Col", "Sgt", "Cpl", "Rev", "Hon", "Gov", "Sen", "Rep",
+    "vs", "etc", "approx", "e.g", "i.e", "cf",
+}
+
+# Terminator run, optional closing quotes/brackets, then whitespace.
+_BOUNDARY = re.compile(r'(\.{2,}|…|[.!?]+)(["\'”’)\]]*)(\s+)')
+_PENDING_TAIL = re.compile(r'[.!?…"\'”’)\]]*$')
+_LAST_WORD = re.compile(r'([\w.]+)$')
+_DOTTED = re.compile(r'^(?:\w\.)+\w$')
+_COMPLETE = re.compile(r'[.!?…]["\'”’)\]]*$')
+_TERMINATOR = re.compile(r'[.!?…]')
+
+
+class SentenceSegmenter:
+    """
+    Split a stream of text into sentences.
+
+    Handles abbreviations ("Dr. Smith"), initials ("J. R. Tolkien"), ellipses, and
+    dialogue where the sentence carries on after a quote ("Stop!" he said.).
+    A boundary is only confirmed once the character after it has arrived, so
+    chunks may split text anywhere.
+    """
+
+    def __init__(self):
+        self.sentences = []
+        self._word_ends = []
+        self._buf = ""
+        # Chunks after _buf that hold no terminator; joined only when one arrives.
+        self._held = []
+        self._pos = 0
+        self._tail_complete = True
+        self._finished = False
+
+    def feed(self, chunk):
+        """Consume the next chunk of text and split off any completed sentences."""
+        if not chunk:
+            return
+        if self._finished:
+            raise RuntimeError("feed() called after finish()")
+        if self._pos == len(self._buf) and not _TERMINATOR.search(chunk):
+            # Nothing pending and no terminator: no boundary can be confirmed yet.
+            self._held.append(chunk)
+            return
+        buf = self._buf + ''.join(self._held) + chunk
+        self._held = []
+        start = 0
+        pos = self._pos
+        while True:
+            m = _BOUNDARY.search(buf, pos)
+            if m is None:
+                pos = _PENDING_TAIL.search(buf, pos).start()
+                break
+            if m.end() == len(buf):
+                # Need the next character to decide.
+                pos = m.start()
+                break
+            pos = m.end()
+            if self._is_boundary(buf, start, m):
+                self._add(buf[start:m.end(2)])
+                start = m.end()
+        self._buf = buf[start:]
+        self._pos = pos - start
+
+    def finish(self):
+        """Flush any remaining text as the final (possibly unterminated) sentence."""
+        if self._finished:
+            return
+        self._finished = True
+        rest = (self._buf + ''.join(self._held)).strip()
+        self._buf = ""
+        self._held = []
+        self._pos = 0
+        if rest:
+            self._add(rest)
+            self._tail_complete = bool(_COMPLETE.search(rest))
+
+    @property
+    def word_count(self):
+        """Number of whitespace-separated words in all completed sentences."""
+        return self._word_ends[-1] if self._word_ends else 0
+
+    def sentences_within(self, max_words):
+        """Return the longest prefix of complete sentences holding at most max_words words."""
+        count = bisect.bisect_right(self._word_ends, max_words)
+        if count == len(self.sentences) and not self._tail_complete:
+            count -= 1
+        return self.sentences[:count]
+
+    def trimmed(self, max_words):
+        """Return the text cut to at most max_words, ending at the last complete sentence."""
+        if max_words <= 0 or self.word_count <= max_words:
+            return ' '.join(self.sentences)
+        sentences = self.sentences_within(max_words)
+        if sentences:
+            return ' '.join(sentences)
+        return ' '.join(self.sentences[0].split()[:max_words])
+
+    def paragraphs(self, sentences_per_paragraph=3, max_words=None):
+        """
+        Return the text as paragraphs of about sentences_per_paragraph sentences,
+        optionally trimmed to max_words first.
+        """
+        sentences = self.sentences
+        if max_words is not None and 0 < max_words < self.word_count:
+            sentences = self.sentences_within(max_words)
+            if not sentences:
+                return self.trimmed(max_words)
+        result = []
+        for i in range(0, len(sentences), sentences_per_paragraph):
+            result.append(' '.join(sentences[i:i + sentences_per_paragraph]))
+        return '\n\n'.join(result)
+
+    def _is_boundary(self, buf, start, m):
+        nxt = buf[m.end()]
+        if nxt.islower():
+            return False
+        if m.group(1) != '.' or m.group(2):
+            return True
+        word = _LAST_WORD.search(buf, max(start, m.start() - 16), m.start())
+        if word is None:
+            return True
+        word = word.group(1)
+        if word in ABBREVIATIONS or _DOTTED.match(word):
+            return False
+        # Single capital letter other than "I": an initial.
+        return not (len(word) == 1 and word.isupper() and word != "I")
+
+    def _add(self, sentence):
+        sentence = sentence.strip()
+        if not sentence:
+            return
+        self.sentences.append(sentence)
+        self._word_ends.append(self.word_count + len(sentence.split()))
+
+
+if __name__ == "__main__":
+    # Micro-benchmark: python segmenter.py
+    import timeit
+
+    sample = (
+        'Dr. Reyes stepped off the train... The platform was empty. "Hello?" she called. '
+        '"Is anyone here?" No answer came. Mr. J. Okafor had promised to meet her at noon! '
+        'She checked her watch, frowned, and walked toward the U.S. Customs office.\n\n'
+    )
+    for repeats in (100, 1000, 10000):
+        text = sample * repeats
+        words = len(text.split())
+        max_words = words // 2
+        chunks = [text[i:i + 4000] for i in range(0, len(text), 4000)]
+
+        def run_regex():
+            # Previous utils.py path: split once to trim, again to format.
+            truncated = ' '.join(text.split()[:max_words])
+            parts = re.split(r'(?<=[.!?])\s+', truncated)
+            trimmed = ' '.join(p for p in parts if re.search(r'[.!?]["\']?$', p.strip()))
+            sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', trimmed) if s.strip()]
+            return '\n\n'.join(' '.join(sentences[i:i + 3]) for i in range(0, len(sentences), 3))
+
+        def run_feed():
+            s = SentenceSegmenter()
+            for chunk in chunks:
+                s.feed(chunk)
+            s.finish()
+            return s
+
+        fed = run_feed()
+
+        n = 5
+        t_regex = timeit.timeit(run_regex, number=n) / n
+        t_feed = timeit.timeit(run_feed, number=n) / n
+        t_final = timeit.timeit(lambda: fed.paragraphs(3, max_words=max_words), number=n) / n
+        print(f"{words:>8} words  old trim + format: {t_regex * 1000:8.2f} ms  "
+              f"new total: {(t_feed + t_final) * 1000:8.2f} ms "
+              f"(feed + finish {t_feed * 1000:.2f}, paragraphs {t_final * 1000:.2f})")
+
+    # Streaming case: token-sized chunks through a long stretch with no boundary.
+    for words in (10000, 100000):
+        run_on = ' '.join(['and then'] * (words // 2))
+        tokens = [run_on[i:i + 4] for i in range(0, len(run_on), 4)]
+
+        def run_tokens():
+            s = SentenceSegmenter()
+            for token in tokens:
+                s.feed(token)
+            s.finish()
+
+        t_tokens = timeit.timeit(run_tokens, number=1)
+        print(f"{words:>8} words, no boundary, 4-char chunks: {t_tokens * 1000:8.2f} ms")
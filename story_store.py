@@ -0,0 +1,220 @@
+"""
+Bounded storage for generated stories.
+Session state keeps only a handle; story bodies are zlib-compressed and held in an
+LRU cache with a byte budget, spilling to disk on eviction.
+"""
+import os
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+
+from config import STORY_STORE_DIR, STORY_STORE_MAX_FILES, STORY_STORE_MAX_MEMORY_BYTES
+
+
+class StoryStore:
+    """Compressed, LRU-bounded story bodies keyed by opaque handles."""
+
+    def __init__(self, directory=STORY_STORE_DIR, max_memory_bytes=STORY_STORE_MAX_MEMORY_BYTES,
+                 max_files=STORY_STORE_MAX_FILES):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_files = max_files
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # Handles spilled to disk, oldest first, and bodies still being written.
+        self._disk = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._clear_directory()
+
+    def put(self, story):
+        """Store story and return its handle."""
+        handle = uuid.uuid4().hex
+        data = zlib.compress(story.encode("utf-8"))
+        with self._lock:
+            self._memory[handle] = data
+            self._memory_bytes += len(data)
+            spilled, pruned = self._evict()
+        # Disk I/O happens outside the lock so get() on other sessions is not held up.
+        self._spill(spilled)
+        self._remove_files(pruned)
+        return handle
+
+    def get(self, handle):
+        """Return the story for handle, or None if it has been evicted or deleted."""
+        if not handle:
+            return None
+        with self._lock:
+            data = self._memory.get(handle)
+            if data is not None:
+                self._memory.move_to_end(handle)
+            else:
+                data = self._pending.get(handle)
+                if data is None and handle not in self._disk:
+                    return None
+        if data is None:
+            try:
+                with open(self._path(handle), "rb") as f:
+                    data = f.read()
+            except OSError:
+                return None
+        return zlib.decompress(data).decode("utf-8")
+
+    def delete(self, handle):
+        """Drop the story for handle from memory and disk."""
+        if not handle:
+            return
+        with self._lock:
+            data = self._memory.pop(handle, None)
+            if data is not None:
+                self._memory_bytes -= len(data)
+            on_disk = handle in self._disk
+            self._disk.pop(handle, None)
+            self._pending.pop(handle, None)
+        if on_disk:
+            self._remove_files([handle])
+
+    @property
+    def memory_bytes(self):
+        """Compressed bytes currently held in memory."""
+        return self._memory_bytes
+
+    def _path(self, handle):
+        return os.path.join(self.directory, f"{handle}.z")
+
+    def _clear_directory(self):
+        """
+        Delete stories spilled by an earlier process. Their handles lived in that
+        process's session state, so nothing can ask for them again.
+        """
+        try:
+            names = [e.name for e in os.scandir(self.directory) if e.name.endswith(".z")]
+        except OSError:
+            return
+        self._remove_files(name[:-2] for name in names)
+
+    def _evict(self):
+        """
+        Move least recently used stories out of memory until it is under budget.
+        Must be called with self._lock held. Returns (spilled, pruned): bodies to
+        write to disk and handles whose files should be deleted.
+        """
+        spilled = []
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            handle, data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(data)
+            self._pending[handle] = data
+            self._disk[handle] = None
+            spilled.append((handle, data))
+        return spilled, self._prune()
+
+    def _prune(self):
+        """Forget the oldest spilled stories beyond max_files and return their handles."""
+        pruned = []
+        while len(self._disk) > self.max_files:
+            handle, _ = self._disk.popitem(last=False)
+            self._pending.pop(handle, None)
+            pruned.append(handle)
+        return pruned
+
+    def _spill(self, spilled):
+        if not spilled:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError as e:
+            print(f"Story store could not create {self.directory}: {e}")
+        for handle, data in spilled:
+            try:
+                with open(self._path(handle), "wb") as f:
+                    f.write(data)
+            except OSError as e:
+                print(f"Story store could not spill {handle} to disk: {e}")
+                with self._lock:
+                    self._disk.pop(handle, None)
+            with self._lock:
+                self._pending.pop(handle, None)
+                # Deleted or pruned while being written.
+                stale = handle not in self._disk
+            if stale:
+                self._remove_files([handle])
+
+    def _remove_files(self, handles):
+        for handle in handles:
+            try:
+                os.remove(self._path(handle))
+            except OSError:
+                pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_story_store():
+    """Return the process-wide story store shared by all sessions."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StoryStore()
+        return _store
+
+
+if __name__ == "__main__":
+    # Memory per session under a simulated session count: python story_store.py
+    import hashlib
+    import tempfile
+    import tracemalloc
+
+    from pydoc_data.topics import topics
+
+    from config import WORDS_PER_PAGE
+
+    # Real, non-repeating English prose (the stdlib's help topics), so compression is
+    # close to what a story gets (~2.5x with zlib). ASCII only: a single curly quote or
+    # dash doubles CPython's per-character size, which would flatter the store.
+    corpus = [w for w in " ".join(topics.values()).split() if w.isascii()]
+
+    def make_text(i, words):
+        offset = (i * 7919) % (len(corpus) - words)
+        return " ".join(corpus[offset:offset + words])
+
+    def make_inputs(i):
+        # The form tuple: persona, three free-text areas, dropdowns, pages, backend.
+        return ("Mystery Novelist", make_text(i, 60), make_text(i + 1, 60), make_text(i + 2, 60),
+                "😎 Casual", "⏳ Suspenseful", "👤 First Person", "🧑‍🦳 Adults", "🔵 PG-13",
+                "🔀 Twist", 1 + i % 10, "groq")
+
+    def measure(sessions, build):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build(sessions)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        return (after - before) / sessions
+
+    def inline_sessions(sessions):
+        # Previous forms.py session state: the story and the inputs tuple.
+        return [{"last_story": make_text(i, (1 + i % 10) * WORDS_PER_PAGE), "last_inputs": make_inputs(i)}
+                for i in range(sessions)]
+
+    for sessions in (100, 1000, 5000):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = StoryStore(tmp)
+
+            def handle_sessions(n):
+                result = []
+                for i in range(n):
+                    story = make_text(i, (1 + i % 10) * WORDS_PER_PAGE)
+                    inputs_key = hashlib.sha1(repr(make_inputs(i)).encode("utf-8")).hexdigest()
+                    result.append({"story_handle": store.put(story), "last_inputs_key": inputs_key})
+                return result
+
+            inline = measure(sessions, inline_sessions)
+            handled = measure(sessions, handle_sessions)
+            print(f"{sessions:>6} sessions  session state before: {inline / 1024:6.1f} KiB/session  "
+                  f"with store: {handled / 1024:6.1f} KiB/session  "
+                  f"(compressed in memory {store.memory_bytes / 1024 / 1024:.1f} MiB, "
+                  f"spilled {len(store._disk)})")
@@ -0,0 +1,229 @@
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import pytest
+
+import quota
+from quota import FairScheduler, QuotaExceededError, UsageLedger, predicted_calls
+
+
+class _Response:
+    def __init__(self, text="ok", tokens=5):
+        self.text = text
+        self.tokens = tokens
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    """Replace generate_with_retry; each call makes `attempts` API requests."""
+    state = {"attempts": 1}
+
+    def fake(client, prompt, model_name, backend="gemini", on_attempt=None):
+        for _ in range(state["attempts"]):
+            if on_attempt is not None:
+                on_attempt(model_name)
+        return _Response(prompt)
+
+    monkeypatch.setattr(quota, "generate_with_retry", fake)
+    return state
+
+
+def make_scheduler(tmp_path, per_minute=100, per_day=1000, tenant_per_minute=100, tenant_per_day=1000):
+    return FairScheduler(
+        UsageLedger(str(tmp_path / "usage.sqlite3")),
+        {"groq": {"per_minute": per_minute, "per_day": per_day}},
+        {"groq": {"per_minute": tenant_per_minute, "per_day": tenant_per_day}},
+    )
+
+
+def recorded_tenants(scheduler):
+    with closing(sqlite3.connect(scheduler.ledger.path)) as conn:
+        return [row[0] for row in conn.execute("SELECT tenant FROM usage ORDER BY id")]
+
+
+def start(scheduler, tenant, results=None, **kwargs):
+    def run():
+        try:
+            scheduler.generate(tenant, None, tenant, "m", "groq", **kwargs)
+            if results is not None:
+                results.append(tenant)
+        except Exception as e:
+            if results is not None:
+                results.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def wait_for_queue(scheduler, length, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with scheduler._cond:
+            if len(scheduler._queue) == length:
+                return
+        time.sleep(0.01)
+    raise AssertionError(f"queue never reached {length} entries")
+
+
+def test_weighted_fair_order(tmp_path, fake_api, monkeypatch):
+    scheduler = make_scheduler(tmp_path, per_minute=0)
+    scheduler.set_weight("b", 2.5)
+    # Backend is at its per-minute quota, so every call queues.
+    threads = [start(scheduler, "a") for _ in range(3)]
+    threads += [start(scheduler, "b") for _ in range(3)]
+    wait_for_queue(scheduler, 6)
+
+    granted = []
+    original = scheduler._under_minute_limits
+
+    def logged(tenant, backend):
+        granted.append(tenant)
+        return original(tenant, backend)
+
+    monkeypatch.setattr(scheduler, "_under_minute_limits", logged)
+    with scheduler._cond:
+        scheduler.backend_limits["groq"]["per_minute"] = 100
+        scheduler._dispatch()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    # Tags: a = 1, 2, 3; b = 0.4, 0.8, 1.2.
+    assert granted == ["b", "b", "a", "b", "a", "a"]
+    assert sorted(recorded_tenants(scheduler)) == ["a", "a", "a", "b", "b", "b"]
+
+
+def test_per_minute_quota_blocks_only_that_tenant(tmp_path, fake_api):
+    scheduler = make_scheduler(tmp_path, tenant_per_minute=2)
+    scheduler.generate("a", None, "p", "m", "groq")
+    scheduler.generate("a", None, "p", "m", "groq")
+
+    results = []
+    blocked = start(scheduler, "a", results)
+    wait_for_queue(scheduler, 1)
+    other = start(scheduler, "b", results)
+    other.join(timeout=5)
+    assert results == ["b"]
+    assert blocked.is_alive()
+
+    with scheduler._cond:
+        scheduler.tenant_limits["groq"]["per_minute"] = 3
+        scheduler._dispatch()
+    blocked.join(timeout=5)
+    assert results == ["b", "a"]
+
+
+def test_error_while_waiting_does_not_block_queue(tmp_path, fake_api, monkeypatch):
+    scheduler = make_scheduler(tmp_path, per_minute=0)
+    original = scheduler._under_minute_limits
+
+    def flaky(tenant, backend):
+        if tenant == "a":
+            raise sqlite3.OperationalError("database is locked")
+        return original(tenant, backend)
+
+    results = []
+    first = start(scheduler, "a", results)
+    wait_for_queue(scheduler, 1)
+    monkeypatch.setattr(scheduler, "_under_minute_limits", flaky)
+    with scheduler._cond:
+        scheduler.backend_limits["groq"]["per_minute"] = 100
+    first.join(timeout=5)
+    assert isinstance(results[0], sqlite3.OperationalError)
+    assert scheduler._queue == []
+
+    start(scheduler, "b", results).join(timeout=5)
+    assert results[1] == "b"
+
+
+def test_unknown_backend_is_rejected(tmp_path, fake_api):
+    scheduler = make_scheduler(tmp_path)
+    with pytest.raises(ValueError):
+        scheduler.generate("a", None, "p", "m", "gemini")
+    assert scheduler._queue == []
+
+
+def test_every_attempt_is_recorded(tmp_path, fake_api):
+    scheduler = make_scheduler(tmp_path)
+    fake_api["attempts"] = 2
+    scheduler.generate("a", None, "p", "m", "groq")
+    assert scheduler.ledger.usage("groq", quota.DAY, "a") == (2, 5)
+
+
+def test_daily_quota_is_checked_when_granted(tmp_path, fake_api):
+    scheduler = make_scheduler(tmp_path, per_minute=0, per_day=1)
+    # Both calls pass the check before queueing while nothing has been used.
+    results = []
+    threads = [start(scheduler, tenant, results) for tenant in ("a", "b")]
+    wait_for_queue(scheduler, 2)
+    with scheduler._cond:
+        scheduler.backend_limits["groq"]["per_minute"] = 100
+        scheduler._dispatch()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert sum(isinstance(r, QuotaExceededError) for r in results) == 1
+    assert len(recorded_tenants(scheduler)) == 1
+    # The refused request gave its per-minute slot back.
+    assert scheduler._minute_count("groq", time.time()) == 1
+
+
+def test_retries_wait_for_the_per_minute_quota(tmp_path, fake_api):
+    scheduler = make_scheduler(tmp_path, tenant_per_minute=1)
+    fake_api["attempts"] = 2
+    results = []
+    thread = start(scheduler, "a", results)
+    wait_for_queue(scheduler, 1)
+    assert recorded_tenants(scheduler) == ["a"]
+
+    with scheduler._cond:
+        scheduler.tenant_limits["groq"]["per_minute"] = 2
+        scheduler._dispatch()
+    thread.join(timeout=5)
+    assert results == ["a"]
+    assert recorded_tenants(scheduler) == ["a", "a"]
+
+
+def test_idle_tenants_are_forgotten(tmp_path, fake_api):
+    scheduler = make_scheduler(tmp_path)
+    for tenant in ("a", "b", "c"):
+        scheduler.generate(tenant, None, "p", "m", "groq")
+    with scheduler._cond:
+        assert set(scheduler._last_tag) == {"a", "b", "c"}
+        scheduler._prune_idle(time.time() + quota.MINUTE + 1)
+        assert scheduler._last_tag == {}
+        assert scheduler._minute == {}
+
+    # A returning tenant is scheduled as if it had never left.
+    scheduler.generate("a", None, "p", "m", "groq")
+    assert scheduler._last_tag["a"] == scheduler._virtual
+
+
+def test_admission_reserves_predicted_calls(tmp_path, fake_api):
+    needed = predicted_calls(1)
+    scheduler = make_scheduler(tmp_path, per_day=needed + 1)
+
+    reservation, _ = scheduler.admit("a", "groq", 1)
+    assert reservation is not None
+    refused, reason = scheduler.admit("b", "groq", 1)
+    assert refused is None and reason
+
+    # Reserved calls are spent without tripping the daily check.
+    for _ in range(needed):
+        scheduler.generate("a", None, "p", "m", "groq", reservation=reservation)
+    scheduler.release(reservation)
+    scheduler.generate("b", None, "p", "m", "groq")
+    with pytest.raises(QuotaExceededError):
+        scheduler.generate("b", None, "p", "m", "groq")
+
+
+def test_release_returns_unused_calls(tmp_path, fake_api):
+    needed = predicted_calls(1)
+    scheduler = make_scheduler(tmp_path, per_day=needed)
+    reservation, _ = scheduler.admit("a", "groq", 1)
+    scheduler.generate("a", None, "p", "m", "groq", reservation=reservation)
+    assert scheduler.admit("b", "groq", 1)[0] is None
+    scheduler.release(reservation)
+    assert scheduler.remaining_today("b", "groq") == needed - 1
@@ -0,0 +1,76 @@
+import pytest
+
+from segmenter import SentenceSegmenter
+
+TEXT = (
+    'Dr. Reyes met Mr. J. R. R. Tolkien at the U.S. Embassy... The hall was empty. '
+    '"Stop!" he said. "Why?" she asked. It was I. Nobody else came. '
+    'Wait... what was that? She ran'
+)
+
+SENTENCES = [
+    'Dr. Reyes met Mr. J. R. R. Tolkien at the U.S. Embassy...',
+    'The hall was empty.',
+    '"Stop!" he said.',
+    '"Why?" she asked.',
+    'It was I.',
+    'Nobody else came.',
+    'Wait... what was that?',
+    'She ran',
+]
+
+
+def feed_in_chunks(text, size):
+    segmenter = SentenceSegmenter()
+    for i in range(0, len(text), size):
+        segmenter.feed(text[i:i + size])
+    segmenter.finish()
+    return segmenter
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 7, 13, len(TEXT)])
+def test_same_sentences_for_any_chunking(size):
+    assert feed_in_chunks(TEXT, size).sentences == SENTENCES
+
+
+def test_abbreviations_initials_and_dialogue():
+    sentences = feed_in_chunks(TEXT, len(TEXT)).sentences
+    assert sentences[0].startswith('Dr. Reyes met Mr. J. R. R. Tolkien at the U.S. Embassy')
+    assert '"Stop!" he said.' in sentences
+
+
+def test_ellipsis_before_lowercase_continues_sentence():
+    assert 'Wait... what was that?' in feed_in_chunks(TEXT, 5).sentences
+
+
+def test_word_counts_track_sentences():
+    segmenter = feed_in_chunks(TEXT, 3)
+    assert segmenter.word_count == len(TEXT.split())
+
+
+def test_paragraphs_drop_incomplete_trailing_sentence_when_trimming():
+    segmenter = feed_in_chunks(TEXT, 4)
+    max_words = segmenter.word_count - 1
+    text = segmenter.paragraphs(sentences_per_paragraph=3, max_words=max_words)
+    assert text.split('\n\n') == [
+        ' '.join(SENTENCES[0:3]),
+        ' '.join(SENTENCES[3:6]),
+        SENTENCES[6],
+    ]
+
+
+def test_paragraphs_keep_incomplete_tail_when_under_budget():
+    segmenter = feed_in_chunks(TEXT, 4)
+    text = segmenter.paragraphs(sentences_per_paragraph=4, max_words=segmenter.word_count)
+    assert text.endswith('She ran')
+
+
+def test_trim_falls_back_to_words_without_a_complete_sentence():
+    segmenter = feed_in_chunks('one two three four five', 2)
+    assert segmenter.trimmed(3) == 'one two three'
+
+
+def test_feed_after_finish_raises():
+    segmenter = feed_in_chunks('Done.', 1)
+    with pytest.raises(RuntimeError):
+        segmenter.feed('More.')